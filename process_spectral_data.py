@@ -1,19 +1,38 @@
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
+import matplotlib
+# Headless Agg backend: skips GUI/font init and renders straight to buffers
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from scipy import signal
+from scipy import ndimage, signal
 from geochemical_plotter import analyze_geochemical_data
 
+plt.rcParams['path.simplify_threshold'] = 1.0
+plt.rcParams['agg.path.chunksize'] = 10000
+
+# One figure reused by every plot call; allocating a fresh canvas and
+# font caches per plot costs tens of milliseconds each time
+_FIG, _AX = plt.subplots(figsize=(12, 6))
+
+# Savitzky-Golay first-derivative kernel, computed once instead of on
+# every savgol_filter call
+SAVGOL_WINDOW = 5
+SAVGOL_POLYORDER = 2
+_SAVGOL_DERIV_COEFFS = signal.savgol_coeffs(SAVGOL_WINDOW, SAVGOL_POLYORDER, deriv=1)
+
 def read_wavelength_file(base_path):
     """Read the wavelength values from the standard wavelength file."""
     wavelength_file = os.path.join(base_path, '..', 'splib07b_Wavelengths_ASDFR_0.35-2.5microns_2151ch.txt')
     try:
-        with open(wavelength_file, 'r') as f:
-            lines = f.readlines()
-            # Skip header line
-            wavelengths = [float(line.strip()) for line in lines[1:] if line.strip()]
-        return np.array(wavelengths)
+        # Skip the header line, then parse the rest of the stream in one
+        # np.fromfile call with no intermediate line list
+        with open(wavelength_file, 'rb') as f:
+            f.readline()
+            return np.fromfile(f, dtype=np.float32, sep=' ')
     except Exception as e:
         print(f"Error reading wavelength file: {str(e)}")
         return None
@@ -22,97 +41,149 @@ def read_spectral_file(file_path):
     """Read a spectral data file and return reflectance data."""
     try:
         print(f"Reading file: {file_path}")
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-            # Skip header line
-            reflectance = [float(line.strip()) for line in lines[1:] if line.strip()]
-        return np.array(reflectance)
+        # Skip the header line, then parse the rest of the stream in one
+        # np.fromfile call with no intermediate line list
+        with open(file_path, 'rb') as f:
+            f.readline()
+            return np.fromfile(f, dtype=np.float32, sep=' ')
     except Exception as e:
         print(f"Error reading file {file_path}: {str(e)}")
         return None
 
-def calculate_derivative(wavelength, reflectance, window_length=5, polyorder=2):
-    """Calculate the first derivative of the reflectance spectrum."""
+def calculate_derivatives(spectra):
+    """Calculate first derivatives of one or more reflectance spectra.
+
+    Applies the precomputed Savitzky-Golay kernel along the last axis in a
+    single vectorized convolution, so a whole (N, channels) matrix of
+    spectra is filtered in one call. Edges are padded by replication.
+    """
     try:
-        return signal.savgol_filter(reflectance, window_length, polyorder, deriv=1)
+        return ndimage.convolve1d(np.asarray(spectra, dtype=np.float32),
+                                  _SAVGOL_DERIV_COEFFS, axis=-1, mode='nearest')
     except Exception as e:
-        print(f"Error calculating derivative: {str(e)}")
+        print(f"Error calculating derivatives: {str(e)}")
         return None
 
-def plot_swir_spectra(spectra_data, wavelengths, title, output_file, derivative=False):
-    """Plot multiple spectra focusing on the SWIR region (1.4-2.5 μm)."""
+def calculate_derivative(wavelength, reflectance):
+    """Calculate the first derivative of a single reflectance spectrum."""
+    return calculate_derivatives(reflectance)
+
+def compute_swir_slice(wavelengths):
+    """Return the index slice covering the SWIR region (1.4-2.5 μm).
+
+    Wavelengths are monotonically increasing, so a searchsorted slice
+    replaces the per-call boolean mask and yields zero-copy views.
+    """
+    i0, i1 = np.searchsorted(wavelengths, [1.4, 2.5])
+    return slice(i0, min(i1 + 1, len(wavelengths)))
+
+def plot_swir_spectra(names, spectra, wavelengths, swir_slice, title, output_file, derivative=False):
+    """Plot multiple spectra focusing on the SWIR region (1.4-2.5 μm).
+
+    Expects the spectra as an (N, channels) matrix with a parallel list of
+    display labels, plus the precomputed SWIR slice from
+    compute_swir_slice. Callers pass precomputed derivative matrices
+    directly; the derivative flag only selects the y-axis label.
+    """
     try:
-        # Filter wavelengths for SWIR region
-        swir_mask = (wavelengths >= 1.4) & (wavelengths <= 2.5)
-        swir_wavelengths = wavelengths[swir_mask]
-        
-        plt.figure(figsize=(12, 6))
-        for mineral, reflectance in spectra_data.items():
-            if derivative:
-                y_data = calculate_derivative(wavelengths, reflectance)
-                if y_data is None:
-                    continue
-            else:
-                y_data = reflectance
-            
-            # Filter reflectance data for SWIR region
-            swir_reflectance = y_data[swir_mask]
-            
-            # Get mineral name from file path
-            mineral_name = os.path.basename(mineral).split('_')[0]
-            plt.plot(swir_wavelengths, swir_reflectance, label=mineral_name)
-        
-        plt.xlabel('Wavelength (μm)')
-        plt.ylabel('First Derivative' if derivative else 'Reflectance')
-        plt.title(title)
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
-        plt.close()
+        swir_wavelengths = wavelengths[swir_slice]
+
+        # Slice the whole matrix once; rows are contiguous views
+        swir_matrix = spectra[:, swir_slice]
+
+        _AX.clear()
+        for mineral_name, swir_reflectance in zip(names, swir_matrix):
+            _AX.plot(swir_wavelengths, swir_reflectance, label=mineral_name, rasterized=True)
+
+        _AX.set_xlabel('Wavelength (μm)')
+        _AX.set_ylabel('First Derivative' if derivative else 'Reflectance')
+        _AX.set_title(title)
+        _AX.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+        _AX.grid(True)
+        _FIG.tight_layout()
+        # dpi=150 halves the rasterized area; bbox_inches='tight' is
+        # dropped because it forces a second full render
+        _FIG.savefig(output_file, dpi=150)
         print(f"Successfully saved SWIR plot to {output_file}")
     except Exception as e:
         print(f"Error plotting SWIR spectra: {str(e)}")
 
-def find_mineral_files(mineral_name, base_path):
-    """Find all files related to a specific mineral."""
-    mineral_files = []
+def index_mineral_files(base_path, minerals):
+    """Walk the spectral library once and index candidate files by mineral.
+
+    A single compiled regex alternation over all mineral names tests each
+    filename in one C-level pass, instead of one Python substring check per
+    mineral per file. Walking the whole tree per mineral would also repeat
+    the same directory traversal, so both the walk and the matching happen
+    exactly once.
+    """
+    mineral_files = {mineral: [] for mineral in minerals}
+    pattern = re.compile('|'.join(map(re.escape, minerals)), re.IGNORECASE)
     try:
         for root, _, files in os.walk(base_path):
             for file in files:
-                if (mineral_name.lower() in file.lower() and 
-                    file.endswith('.txt') and 
-                    'ASDFR' in file and 
+                if (file.endswith('.txt') and
+                    'ASDFR' in file and
                     'AREF' in file):
-                    mineral_files.append(os.path.join(root, file))
+                    match = pattern.search(file)
+                    if match:
+                        mineral_files[match.group(0).lower()].append(os.path.join(root, file))
         return mineral_files
     except Exception as e:
-        print(f"Error finding mineral files: {str(e)}")
-        return []
+        print(f"Error indexing mineral files: {str(e)}")
+        return mineral_files
 
-def process_mineral_data(mineral_name, base_path, wavelengths):
-    """Process all spectral data files for a given mineral."""
-    mineral_data = {}
-    print(f"\nLooking for {mineral_name} in {base_path}")
-    
-    if not os.path.exists(base_path):
-        print(f"Directory not found: {base_path}")
-        return mineral_data
-    
-    mineral_files = find_mineral_files(mineral_name, base_path)
+def save_mineral_csv(mineral_name, names, spectra, derivatives, wavelengths):
+    """Save wavelength, reflectance and derivative columns per sample as CSV.
+
+    Reuses the derivative matrix already computed for plotting; each sample
+    is serialized with np.savetxt, which formats the numeric columns in C
+    instead of building a pandas DataFrame per sample.
+    """
+    try:
+        for name, reflectance, derivative in zip(names, spectra, derivatives):
+            sample = os.path.splitext(os.path.basename(name))[0]
+            data = np.column_stack([wavelengths, reflectance, derivative])
+            output_file = f'{mineral_name}_{sample}.csv'
+            np.savetxt(output_file, data, delimiter=',', fmt='%.6f',
+                       header='wavelength,reflectance,derivative', comments='')
+        print(f"Saved {len(names)} CSV files for {mineral_name}")
+    except Exception as e:
+        print(f"Error saving CSV data for {mineral_name}: {str(e)}")
+
+def process_mineral_data(mineral_name, mineral_files, wavelengths):
+    """Process the spectral data files indexed for a given mineral.
+
+    Returns a list of file paths and a matching (N, channels) float32
+    matrix of reflectance spectra, keeping all samples of a mineral in
+    one contiguous array.
+    """
+    names = []
+    spectra = []
+    print(f"\nLooking for {mineral_name}")
     print(f"Found {len(mineral_files)} files for {mineral_name}:")
     for file in mineral_files:
         print(f"  {os.path.basename(file)}")
-    
-    for file_path in mineral_files:
-        reflectance = read_spectral_file(file_path)
+
+    # Read files concurrently; the GIL is released during file I/O and
+    # numpy parsing, so threads overlap the many small reads
+    if mineral_files:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(read_spectral_file, mineral_files))
+    else:
+        results = []
+
+    for file_path, reflectance in zip(mineral_files, results):
         if reflectance is not None and len(reflectance) > 0:
-            mineral_data[file_path] = reflectance
+            names.append(file_path)
+            spectra.append(reflectance)
             print(f"Successfully processed {os.path.basename(file_path)}")
         else:
             print(f"No valid data found in {os.path.basename(file_path)}")
-    
-    return mineral_data
+
+    if not spectra:
+        return names, None
+    return names, np.stack(spectra)
 
 def main():
     # Define minerals of interest
@@ -139,55 +210,84 @@ def main():
         return
     
     print(f"Successfully read {len(wavelengths)} wavelength values")
-    
+
+    if not os.path.exists(base_path):
+        print(f"Directory not found: {base_path}")
+        return
+
+    # Walk the library once and match all mineral names in a single pass
+    mineral_index = index_mineral_files(base_path, minerals)
+    print(f"Indexed {sum(len(v) for v in mineral_index.values())} candidate spectral files")
+
+    # Precompute the SWIR region slice once for all plots
+    swir_slice = compute_swir_slice(wavelengths)
+
     # Process and plot data for each mineral
     all_mineral_data = {}
     for mineral in minerals:
         print(f"\nProcessing {mineral}...")
-        mineral_data = process_mineral_data(mineral, base_path, wavelengths)
-        
-        if mineral_data:
-            print(f"Found {len(mineral_data)} samples for {mineral}")
-            all_mineral_data[mineral] = mineral_data
-            
+        names, spectra = process_mineral_data(mineral, mineral_index[mineral], wavelengths)
+
+        if spectra is not None:
+            print(f"Found {len(names)} samples for {mineral}")
+
+            # Derive every sample once; plotting and CSV export reuse it
+            derivatives = calculate_derivatives(spectra)
+            if derivatives is None:
+                continue
+            all_mineral_data[mineral] = (names, spectra, derivatives)
+
+            # Derive display labels from the file paths once per mineral
+            # instead of once per plotted line
+            labels = [os.path.basename(name).split('_')[0] for name in names]
+
             # Plot individual mineral spectra (SWIR region only)
             plot_swir_spectra(
-                mineral_data,
+                labels,
+                spectra,
                 wavelengths,
+                swir_slice,
                 f'{mineral.capitalize()} SWIR Spectra',
                 f'{mineral}_swir_spectra.png'
             )
-            
+
             # Plot individual mineral derivative spectra (SWIR region only)
             plot_swir_spectra(
-                mineral_data,
+                labels,
+                derivatives,
                 wavelengths,
+                swir_slice,
                 f'{mineral.capitalize()} SWIR Derivative Spectra',
                 f'{mineral}_swir_derivative.png',
                 derivative=True
             )
-    
+
+            # Save processed data in CSV format
+            save_mineral_csv(mineral, names, spectra, derivatives, wavelengths)
+
     # Plot all minerals together
     if all_mineral_data:
-        # Combine first spectrum of each mineral
-        combined_data = {}
-        for mineral, spectra in all_mineral_data.items():
-            if spectra:
-                first_spectrum = list(spectra.items())[0]
-                combined_data[mineral] = first_spectrum[1]
-        
+        # Combine first spectrum (and its derivative) of each mineral
+        combined_names = list(all_mineral_data)
+        combined_spectra = np.stack([spectra[0] for _, spectra, _ in all_mineral_data.values()])
+        combined_derivatives = np.stack([derivatives[0] for _, _, derivatives in all_mineral_data.values()])
+
         # Plot combined spectra (SWIR region only)
         plot_swir_spectra(
-            combined_data,
+            combined_names,
+            combined_spectra,
             wavelengths,
+            swir_slice,
             'Combined Mineral SWIR Spectra',
             'combined_swir_spectra.png'
         )
-        
+
         # Plot combined derivative spectra (SWIR region only)
         plot_swir_spectra(
-            combined_data,
+            combined_names,
+            combined_derivatives,
             wavelengths,
+            swir_slice,
             'Combined Mineral SWIR Derivative Spectra',
             'combined_swir_derivative.png',
             derivative=True